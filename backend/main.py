@@ -1,13 +1,37 @@
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 import os
-import glob
-import json
+import fcntl
+import hashlib
+import pickle
+import threading
+from contextlib import asynccontextmanager
+import ijson
 import numpy as np
+import orjson
 
-app = FastAPI()
+# Optional: JIT-compiled pose kernel, falls back to batched NumPy without numba
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson, which also handles int keys and numpy arrays."""
+
+    def render(self, content):
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+@asynccontextmanager
+async def lifespan(app):
+    """Precompute poses and warm the image cache before serving traffic."""
+    warm_poses_cache()
+    get_images()
+    yield
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # CORS configuration
 origins = [
@@ -23,10 +47,36 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Dataset profiles, selected with the HCI_DATASET environment variable
+DATASETS = {
+    "activate_cam": {
+        "IMAGE_DIR": "/localhome/zla247/Downloads/activate_cam_ldr_processed/ldr_processed",
+        "SECONDARY_VIDEO_PATH": "/localhome/zla247/Downloads/Activate_Camera.mp4",
+        "CAPTURE_LOG_PATH": "/localhome/zla247/fs01s_cloth/capture_data/HCI_Activate_camera_AprilTag/capture_log.json",
+    },
+}
+DATASET = os.environ.get("HCI_DATASET", "activate_cam")
+if DATASET not in DATASETS:
+    raise RuntimeError(f"Unknown HCI_DATASET {DATASET!r}, expected one of: {', '.join(DATASETS)}")
+
 # Global configuration variables
-IMAGE_DIR = "/localhome/zla247/Downloads/activate_cam_ldr_processed/ldr_processed"
-SECONDARY_VIDEO_PATH = "/localhome/zla247/Downloads/Activate_Camera.mp4"
-CAPTURE_LOG_PATH = "/localhome/zla247/fs01s_cloth/capture_data/HCI_Activate_camera_AprilTag/capture_log.json"
+IMAGE_DIR = DATASETS[DATASET]["IMAGE_DIR"]
+SECONDARY_VIDEO_PATH = DATASETS[DATASET]["SECONDARY_VIDEO_PATH"]
+CAPTURE_LOG_PATH = DATASETS[DATASET]["CAPTURE_LOG_PATH"]
+# Pose sidecar cache lives next to the capture log unless HCI_CACHE_DIR is set.
+# The name includes the dataset and a hash of the log path, since every log is
+# called capture_log.json and profiles may share one HCI_CACHE_DIR.
+POSES_CACHE_DIR = os.environ.get("HCI_CACHE_DIR", os.path.dirname(CAPTURE_LOG_PATH))
+POSES_CACHE_PATH = os.path.join(
+    POSES_CACHE_DIR,
+    "{}.{}.{}.poses.pkl".format(
+        os.path.splitext(os.path.basename(CAPTURE_LOG_PATH))[0],
+        DATASET,
+        hashlib.sha256(os.path.abspath(CAPTURE_LOG_PATH).encode()).hexdigest()[:12],
+    ),
+)
+# Bump when the layout returned by compute_poses_from_log changes
+POSES_CACHE_VERSION = 3
 
 # Camera-to-gripper transformation
 R_c2g = np.array([
@@ -45,135 +95,274 @@ R_l2g = np.array([
 t_l2g = np.array([0.0, -0.102, 0.02112])
 
 # Base2 to Base1 transformation (for light arm)
-base2_to_base1 = np.array([
+BASE2_TO_BASE1 = np.array([
     [9.99999959e-01,  2.33227594e-04, -1.69051819e-04,  7.22042468e-03],
     [-2.36740680e-04,  9.99777598e-01, -2.10878871e-02,  8.26339062e-03],
     [1.64095944e-04,  2.10879262e-02,  9.99777611e-01,  3.93500345e-03],
     [0.00000000e+00,  0.00000000e+00,  0.00000000e+00,  1.00000000e+00]
-])
+], dtype=np.float64)
+
+# Base2-to-base1 split into rotation and translation
+R_b2b1 = np.ascontiguousarray(BASE2_TO_BASE1[:3, :3])
+t_b2b1 = np.ascontiguousarray(BASE2_TO_BASE1[:3, 3])
+IDENTITY_R = np.eye(3)
+ZERO_T = np.zeros(3)
 
-def build_4x4(rotation_matrix, translation):
-    """Build a 4x4 transformation matrix from rotation and translation."""
-    T = np.eye(4)
-    T[:3, :3] = np.array(rotation_matrix)
-    T[:3, 3] = np.array(translation)
-    return T
+if njit is not None:
+    @njit(
+        "void(f8[:, :, ::1], f8[:, ::1], f8[:, ::1], f8[::1], f8[:, ::1], f8[::1], f8[:, ::1], f8[:, :, ::1])",
+        parallel=True, cache=True, fastmath=True,
+    )
+    def _transform_poses_kernel(rotations, translations, pre_R, pre_t, post_R, post_t, out_pos, out_rot):
+        """Numba kernel for transform_poses, fused per frame with no temporaries."""
+        for n in prange(rotations.shape[0]):
+            for i in range(3):
+                # Row i of pre_R @ R
+                a0 = pre_R[i, 0] * rotations[n, 0, 0] + pre_R[i, 1] * rotations[n, 1, 0] + pre_R[i, 2] * rotations[n, 2, 0]
+                a1 = pre_R[i, 0] * rotations[n, 0, 1] + pre_R[i, 1] * rotations[n, 1, 1] + pre_R[i, 2] * rotations[n, 2, 1]
+                a2 = pre_R[i, 0] * rotations[n, 0, 2] + pre_R[i, 1] * rotations[n, 1, 2] + pre_R[i, 2] * rotations[n, 2, 2]
+                # Row i of pre_R @ t + pre_t
+                b = pre_R[i, 0] * translations[n, 0] + pre_R[i, 1] * translations[n, 1] + pre_R[i, 2] * translations[n, 2] + pre_t[i]
+                for j in range(3):
+                    out_rot[n, i, j] = a0 * post_R[0, j] + a1 * post_R[1, j] + a2 * post_R[2, j]
+                out_pos[n, i] = a0 * post_t[0] + a1 * post_t[1] + a2 * post_t[2] + b
+
+def transform_poses(rotations, translations, pre_R, pre_t, post_R, post_t):
+    """Compose pre @ [R | t] @ post for stacked (N, 3, 3) rotations and (N, 3) translations.
+
+    pre and post are rigid transforms given as a 3x3 rotation and a translation,
+    so no homogeneous 4x4 matrices are built:
+        R_world = pre_R @ R @ post_R
+        t_world = pre_R @ (R @ post_t + t) + pre_t
+    Returns (N, 3) translations and (N, 3, 3) rotations, using the Numba kernel
+    when numba is installed.
+    """
+    if njit is None:
+        out_rot = np.matmul(np.matmul(pre_R, rotations), post_R)
+        out_pos = np.matmul(np.matmul(rotations, post_t) + translations, pre_R.T) + pre_t
+        return out_pos, out_rot
+    
+    N = len(rotations)
+    out_pos = np.empty((N, 3))
+    out_rot = np.empty((N, 3, 3))
+    _transform_poses_kernel(
+        np.ascontiguousarray(rotations, dtype=np.float64),
+        np.ascontiguousarray(translations, dtype=np.float64),
+        np.ascontiguousarray(pre_R, dtype=np.float64),
+        np.ascontiguousarray(pre_t, dtype=np.float64),
+        np.ascontiguousarray(post_R, dtype=np.float64),
+        np.ascontiguousarray(post_t, dtype=np.float64),
+        out_pos, out_rot,
+    )
+    return out_pos, out_rot
 
 def compute_poses_from_log():
-    """Compute camera and light poses from the capture log."""
-    with open(CAPTURE_LOG_PATH, 'r') as f:
-        capture_data = json.load(f)
+    """Compute camera and light poses from the capture log.
+
+    Returns a dict of per-field arrays (structure of arrays), indexed by frame.
+    """
+    frame_ids = []
+    cam_rotations = []
+    cam_positions = []
+    cam_servo_angles = []
+    has_light = []
+    light_rotations = []
+    light_positions = []
+    light_servo_angles = []
     
-    poses = []
-    for item in capture_data:
-        frame_id = item['id']
-        
-        # Camera pose computation
-        # Gripper-to-base1 (position in mm, convert to meters)
-        cam_g2b1 = build_4x4(
-            item['camera']['rotation_matrix'],
-            [pos / 1000.0 for pos in item['camera']['position']]
-        )
-        # Camera-to-gripper
-        c2g = build_4x4(R_c2g, t_c2g)
-        # Camera-to-base1 (world)
-        c2w = cam_g2b1 @ c2g
-        
-        # Extract camera position and rotation
-        camera_pos = (c2w[:3, 3] * 1000).tolist()  # Back to mm for scene
-        camera_rot = c2w[:3, :3].tolist()
-        camera_gripper_pos = [pos for pos in item['camera']['position']]  # Already in mm, base1 frame
-        camera_servo_angles = item['camera'].get('servo_angles', [0, 0, 0, 0, 0, 0, 0])[:6]
-        
-        # Light pose computation (optional - may not exist in some datasets)
-        if 'light' in item:
-            # Gripper-to-base2 (position in mm, convert to meters)
-            light_g2b2 = build_4x4(
-                item['light']['rotation_matrix'],
-                [pos / 1000.0 for pos in item['light']['position']]
-            )
-            # Light-to-gripper
-            l2g = build_4x4(R_l2g, t_l2g)
-            # Light-to-base2
-            l2b2 = light_g2b2 @ l2g
-            # Transform to base1 (world) coordinate
-            l2w = base2_to_base1 @ l2b2
-            
-            light_pos = (l2w[:3, 3] * 1000).tolist()
-            light_rot = l2w[:3, :3].tolist()
+    # Stream the log item by item so the whole document is never held in memory.
+    # Servo angles are padded/trimmed to 6 per frame so they stack into (N, 6).
+    with open(CAPTURE_LOG_PATH, 'rb') as f:
+        for item in ijson.items(f, 'item', use_float=True):
+            frame_ids.append(item['id'])
+            cam_rotations.append(item['camera']['rotation_matrix'])
+            cam_positions.append(item['camera']['position'])
+            cam_servo_angles.append((item['camera'].get('servo_angles', []) + [0] * 6)[:6])
             
-            # Light gripper is in base2, transform to base1
-            light_gripper_b2 = np.array([pos / 1000.0 for pos in item['light']['position']] + [1])
-            light_gripper_b1 = base2_to_base1 @ light_gripper_b2
-            light_gripper_pos = (light_gripper_b1[:3] * 1000).tolist()
-            light_servo_angles = item['light'].get('servo_angles', [0, 0, 0, 0, 0, 0, 0])[:6]
-        else:
-            # Default light position (fixed) when no light data
-            light_pos = [0, 300, 400]
-            light_rot = [[1, 0, 0], [0, 1, 0], [0, 0, 1]]
-            light_gripper_pos = [0, 300, 400]
-            light_servo_angles = [0, 0, 0, 0, 0, 0]
-        
-        poses.append({
-            'frame_id': frame_id,
-            'camera': {
-                'position': camera_pos,
-                'rotation': camera_rot,
-                'gripper_position': camera_gripper_pos,
-                'servo_angles': camera_servo_angles
-            },
-            'light': {
-                'position': light_pos,
-                'rotation': light_rot,
-                'gripper_position': light_gripper_pos,
-                'servo_angles': light_servo_angles
-            }
-        })
+            # Light data is optional - may not exist in some datasets
+            has_light.append('light' in item)
+            if 'light' in item:
+                light_rotations.append(item['light']['rotation_matrix'])
+                light_positions.append(item['light']['position'])
+                light_servo_angles.append((item['light'].get('servo_angles', []) + [0] * 6)[:6])
+    
+    N = len(frame_ids)
+    M = len(light_positions)
     
-    return poses
+    # Stack each field into an array once; positions are in mm
+    cam_rot = np.asarray(cam_rotations, dtype=np.float64).reshape(N, 3, 3)
+    cam_pos_mm = np.asarray(cam_positions, dtype=np.float64).reshape(N, 3)
+    cam_servo = np.asarray(cam_servo_angles, dtype=np.float64).reshape(N, 6)
+    light_rot_g2b2 = np.asarray(light_rotations, dtype=np.float64).reshape(M, 3, 3)
+    light_pos_mm = np.asarray(light_positions, dtype=np.float64).reshape(M, 3)
+    
+    # Camera pose computation, batched over all frames
+    # Camera-to-base1 (world): gripper-to-base1 @ camera-to-gripper, positions in meters
+    cam_pos_m, cam_rot_w = transform_poses(cam_rot, cam_pos_mm / 1000.0, IDENTITY_R, ZERO_T, R_c2g, t_c2g)
+    
+    # Light pose computation, batched over the frames that have light data
+    # Light-to-world: base2-to-base1 @ gripper-to-base2 @ light-to-gripper
+    light_pos_m, light_rot_w = transform_poses(light_rot_g2b2, light_pos_mm / 1000.0, R_b2b1, t_b2b1, R_l2g, t_l2g)
+    # Light gripper is in base2, transform to base1 (in mm)
+    light_gripper_b1 = light_pos_mm @ R_b2b1.T + t_b2b1 * 1000
+    
+    # Default light pose (fixed) for frames without light data
+    has_light = np.array(has_light, dtype=bool)
+    light_pos = np.full((N, 3), (0.0, 300.0, 400.0))
+    light_rot = np.tile(np.eye(3), (N, 1, 1))
+    light_gripper_pos = np.full((N, 3), (0.0, 300.0, 400.0))
+    light_servo = np.zeros((N, 6))
+    light_pos[has_light] = light_pos_m * 1000
+    light_rot[has_light] = light_rot_w
+    light_gripper_pos[has_light] = light_gripper_b1
+    light_servo[has_light] = np.asarray(light_servo_angles, dtype=np.float64).reshape(M, 6)
+    
+    # Structure-of-arrays layout, one contiguous array per field. float32 is
+    # plenty for mm positions and rotations rendered in the 3D scene.
+    f32 = np.float32
+    return {
+        'frame_ids': np.array(frame_ids, dtype=np.int64),
+        'camera': {
+            'position': (cam_pos_m * 1000).astype(f32, copy=False),  # Back to mm for scene
+            'rotation': cam_rot_w.astype(f32, copy=False),
+            'gripper_position': cam_pos_mm.astype(f32, copy=False),  # Already in mm, base1 frame
+            'servo_angles': cam_servo.astype(f32, copy=False)
+        },
+        'light': {
+            'position': light_pos.astype(f32, copy=False),
+            'rotation': light_rot.astype(f32, copy=False),
+            'gripper_position': light_gripper_pos.astype(f32, copy=False),
+            'servo_angles': light_servo.astype(f32, copy=False)
+        }
+    }
+
+# Cached poses are only valid for the calibration they were computed with
+POSES_CALIBRATION_HASH = hashlib.sha256(b"".join(
+    np.ascontiguousarray(c, dtype=np.float64).tobytes()
+    for c in (R_c2g, t_c2g, R_l2g, t_l2g, BASE2_TO_BASE1)
+)).hexdigest()
+
+def _capture_log_key():
+    """Identify the capture log contents by path, exact mtime and size."""
+    st = os.stat(CAPTURE_LOG_PATH)
+    return {'path': os.path.abspath(CAPTURE_LOG_PATH), 'mtime_ns': st.st_mtime_ns, 'size': st.st_size}
 
-# Cache the poses on startup
-_cached_poses = None
+def _read_poses_cache(log_key):
+    """Return the cached poses if the sidecar was built from log_key by this code, else None."""
+    if not os.path.exists(POSES_CACHE_PATH):
+        return None
+    try:
+        with open(POSES_CACHE_PATH, 'rb') as f:
+            cached = pickle.load(f)
+    except Exception:
+        # Truncated, unreadable, or written by a different Python/numpy: recompute
+        return None
+    if (isinstance(cached, dict)
+            and cached.get('version') == POSES_CACHE_VERSION
+            and cached.get('calibration') == POSES_CALIBRATION_HASH
+            and cached.get('log') == log_key):
+        return cached['poses']
+    return None
 
-# Mount the image directory to serve static files
-app.mount("/images", StaticFiles(directory=IMAGE_DIR), name="images")
+def load_poses():
+    """Load poses from the sidecar cache, recomputing them if the capture log changed.
+
+    If the cache directory is not writable, poses are computed without caching.
+    """
+    # Taken before parsing, so a log rewritten mid-parse won't match next time
+    log_key = _capture_log_key()
+    try:
+        lock_file = open(POSES_CACHE_PATH + ".lock", 'w')
+    except OSError:
+        # Read-only cache directory: use an existing cache if there is one
+        poses = _read_poses_cache(log_key)
+        return poses if poses is not None else compute_poses_from_log()
+    
+    # Serialize concurrent workers so only one of them recomputes the cache
+    with lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        poses = _read_poses_cache(log_key)
+        if poses is not None:
+            return poses
+        
+        poses = compute_poses_from_log()
+        # Write to a temporary file first so readers never see a partial cache
+        tmp_path = POSES_CACHE_PATH + ".tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(
+                    {'version': POSES_CACHE_VERSION, 'calibration': POSES_CALIBRATION_HASH,
+                     'log': log_key, 'poses': poses},
+                    f, protocol=pickle.HIGHEST_PROTOCOL,
+                )
+            os.replace(tmp_path, POSES_CACHE_PATH)
+        except OSError:
+            pass  # Serve the computed poses even if the cache can't be written
+        return poses
+
+# Cache the pre-encoded /api/poses body on startup; the arrays are not kept
+_cached_poses_bytes = None
+
+def warm_poses_cache():
+    """Load the poses and pre-encode the /api/poses response body."""
+    global _cached_poses_bytes
+    _cached_poses_bytes = orjson.dumps({"poses": load_poses()}, option=orjson.OPT_SERIALIZE_NUMPY)
+
+# Mount the image directory to serve static files, unless a reverse proxy
+# (see nginx.conf) serves /images and the secondary video with sendfile
+if os.environ.get("HCI_STATIC_PROXY") != "1":
+    app.mount("/images", StaticFiles(directory=IMAGE_DIR), name="images")
 app.mount("/assets", StaticFiles(directory="/localhome/zla247/course_projects/HCI/hand_pose_visualizer/frontend"), name="assets")
 
 @app.get("/")
 async def read_index():
     return FileResponse("/localhome/zla247/course_projects/HCI/hand_pose_visualizer/frontend/index.html")
 
-@app.get("/api/images")
-def get_images():
-    """Returns a dict of frame_id -> image filename, matched by ID in filename."""
-    import re
-    # Pattern to match png files
-    pattern = os.path.join(IMAGE_DIR, "*_visualized.png")
-    files = glob.glob(pattern)
+def scan_images():
+    """Scan IMAGE_DIR and return the ordered image list and the frame_id -> filename dict."""
+    prefix = "capture-"
+    suffix = "_visualized.png"
     
     # Build dict mapping frame_id to filename
     images_dict = {}
-    for f in files:
-        filename = os.path.basename(f)
-        # Extract ID from filename like "capture-0000_visualized.png"
-        match = re.search(r'capture-(\d+)_visualized\.png', filename)
-        if match:
-            frame_id = int(match.group(1))
-            images_dict[frame_id] = filename
+    with os.scandir(IMAGE_DIR) as entries:
+        for entry in entries:
+            filename = entry.name
+            # Extract ID from filename like "capture-0000_visualized.png"
+            if filename.startswith(prefix) and filename.endswith(suffix):
+                frame_id = filename[len(prefix):-len(suffix)]
+                if frame_id.isascii() and frame_id.isdigit():
+                    images_dict[int(frame_id)] = filename
     
     # Return as sorted list based on frame IDs from capture log
     # Get max frame ID
     max_id = max(images_dict.keys()) if images_dict else 0
     
     # Build ordered list - use None for missing frames
-    images_list = []
-    for i in range(max_id + 1):
-        if i in images_dict:
-            images_list.append(images_dict[i])
-        else:
-            images_list.append(None)  # Missing frame
+    images_list = [images_dict.get(i) for i in range(max_id + 1)]
+    return images_list, images_dict
+
+# Cache the image scan, invalidated when the directory mtime changes
+_images_cache = None
+_images_cache_mtime = None
+_images_cache_lock = threading.Lock()
+
+@app.get("/api/images")
+def get_images(include_dict: bool = True):
+    """Returns the image filenames ordered by frame ID, matched by ID in filename.
+
+    With include_dict, also returns the frame_id -> filename dict."""
+    global _images_cache, _images_cache_mtime
+    with _images_cache_lock:
+        mtime = os.stat(IMAGE_DIR).st_mtime_ns
+        if _images_cache is None or mtime != _images_cache_mtime:
+            _images_cache = scan_images()
+            _images_cache_mtime = mtime
+        images_list, images_dict = _images_cache
     
-    return {"images": images_list, "images_dict": images_dict}
+    if include_dict:
+        return {"images": images_list, "images_dict": images_dict}
+    return {"images": images_list}
 
 @app.get("/api/secondary-video")
 async def get_secondary_video():
@@ -196,12 +385,21 @@ def get_video_info():
 
 @app.get("/api/poses")
 def get_poses():
-    """Returns camera and light poses for all frames."""
-    global _cached_poses
-    if _cached_poses is None:
-        _cached_poses = compute_poses_from_log()
-    return {"poses": _cached_poses}
+    """Returns camera and light poses for all frames as per-field arrays."""
+    if _cached_poses_bytes is None:
+        warm_poses_cache()
+    # Serve the pre-encoded body, skipping per-request serialization
+    return Response(content=_cached_poses_bytes, media_type="application/json")
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Each worker warms its own caches in lifespan; load_poses shares the sidecar file
+    uvicorn.run(
+        "main:app",
+        app_dir=os.path.dirname(os.path.abspath(__file__)),
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        workers=os.cpu_count(),
+    )
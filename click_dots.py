@@ -2,6 +2,7 @@
 import cv2
 import json
 import os
+import time
 
 # --------- CONFIG ---------
 IMAGE_PATH = "capture-0006.png"        # <-- change to your image
@@ -11,6 +12,7 @@ DOT_COLOR = (0, 255, 0)  # green (BGR)
 # --------------------------
 
 points = []
+dirty = True  # img changed since it was last shown
 
 img = cv2.imread(IMAGE_PATH)
 if img is None:
@@ -21,23 +23,44 @@ win_name = "Click tag corners (L-click add, R-click undo, s=save, r=reset, q=qui
 
 
 def redraw():
-    """Redraw dots only (no numbers)."""
-    global img
+    """Redraw dots only (no numbers). Used for reset; clicks draw incrementally."""
+    global img, dirty
     img = orig.copy()
+    dirty = True
     for (x, y) in points:
         cv2.circle(img, (x, y), DOT_RADIUS, DOT_COLOR, -1)
 
 
+def erase_dot(x, y):
+    """Remove an undone dot by restoring only its bounding box from orig.
+
+    Remaining dots that overlap the box are redrawn into it, clipped to the box.
+    """
+    global dirty
+    h, w = img.shape[:2]
+    x0, y0 = max(x - DOT_RADIUS, 0), max(y - DOT_RADIUS, 0)
+    x1, y1 = min(x + DOT_RADIUS + 1, w), min(y + DOT_RADIUS + 1, h)
+    if x0 >= x1 or y0 >= y1:
+        return
+    roi = img[y0:y1, x0:x1]
+    roi[:] = orig[y0:y1, x0:x1]
+    for (px, py) in points:
+        if abs(px - x) <= 2 * DOT_RADIUS and abs(py - y) <= 2 * DOT_RADIUS:
+            cv2.circle(roi, (px - x0, py - y0), DOT_RADIUS, DOT_COLOR, -1)
+    dirty = True
+
+
 def mouse_cb(event, x, y, flags, param):
-    global points
+    global points, dirty
     if event == cv2.EVENT_LBUTTONDOWN:
+        # Draw just the new dot on top of the current image
         points.append((x, y))
-        redraw()
+        cv2.circle(img, (x, y), DOT_RADIUS, DOT_COLOR, -1)
+        dirty = True
 
     elif event == cv2.EVENT_RBUTTONDOWN:
         if points:
-            points.pop()
-            redraw()
+            erase_dot(*points.pop())
 
 
 cv2.namedWindow(win_name, cv2.WINDOW_NORMAL)
@@ -52,8 +75,16 @@ print("  - 'r': reset")
 print("  - 'q' or ESC: quit")
 
 while True:
-    cv2.imshow(win_name, img)
-    key = cv2.waitKey(20) & 0xFF
+    if dirty:
+        cv2.imshow(win_name, img)
+        dirty = False
+
+    # Non-blocking: pumps GUI events (mouse callbacks) without a fixed delay
+    key = cv2.pollKey()
+    if key == -1:
+        time.sleep(0.005)  # Nothing happened, yield the CPU
+        continue
+    key &= 0xFF
 
     if key in (27, ord('q'), ord('Q')):
         print("Quit without saving.")
@@ -757,28 +757,29 @@ export class RoboticScene3D {
 
     // Set poses data from backend
     setPoses(poses) {
+        // Poses arrive as per-field arrays indexed by frame
         this.poses = poses;
-        console.log('Poses loaded:', poses.length, 'frames');
+        console.log('Poses loaded:', poses.frame_ids.length, 'frames');
     }
 
     // Update scene for a specific frame
     updateFrame(frameIndex) {
-        if (!this.poses || frameIndex >= this.poses.length) {
+        if (!this.poses || frameIndex >= this.poses.frame_ids.length) {
             return;
         }
 
         this.currentFrame = frameIndex;
-        const pose = this.poses[frameIndex];
+        const cameraPoses = this.poses.camera;
 
         // --- Camera Arm IK Update ---
         // Target Position
-        const camPos = pose.camera.position;
+        const camPos = cameraPoses.position[frameIndex];
         const camTargetPos = this.worldToScene(camPos[0], camPos[1], camPos[2]);
         
         // Target Rotation
         let camTargetRot = null;
-        if (pose.camera.rotation) {
-            camTargetRot = pose.camera.rotation;
+        if (cameraPoses.rotation) {
+            camTargetRot = cameraPoses.rotation[frameIndex];
         }
         
         // Solve IK for Camera Arm